@@ -1,510 +1,747 @@
-# app/api/gitpal.py
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import os, shutil, tempfile, requests, re
-from datetime import datetime
-from git import Repo, Actor
-from urllib.parse import urlparse
-
-from app.linter import run_linter, parse_linter_output
-from app.gemini_fix import fix_code_with_gemini   # must support save flag
-
-router = APIRouter()
-
-# ────────────────── Pydantic models ──────────────────
-class AnalyzeRequest(BaseModel):
-    repo_url: str
-    token: str
-
-class FixRequest(BaseModel):
-    file_path: str          # full temp path received from frontend
-    smell_code: str
-    line_number: int
-
-class PreviewResponse(BaseModel):
-    success: bool
-    message: str
-    file_path: str
-    original: str
-    preview_code: str
-
-class FileRequest(BaseModel):
-    file_path: str          # path the frontend wants to read
-
-class SingleFix(BaseModel):
-    file_path: str          # **relative** path inside repo (frontend sends display_path)
-    fixed_code: str
-
-class CommitFixesRequest(BaseModel):
-    repo_url: str
-    token: str
-    fixes: List[SingleFix]
-    create_pr: Optional[bool] = False  # New field to indicate if PR should be created
-    pr_title: Optional[str] = None
-    pr_body: Optional[str] = None
-    base_branch: Optional[str] = "main"  # Default base branch
-
-class PullRequestResponse(BaseModel):
-    success: bool
-    branch: str
-    files_changed: int
-    message: str
-    pr_url: Optional[str] = None
-    pr_number: Optional[int] = None
-
-# ────────────────── Helper Functions ──────────────────
-def extract_repo_info(repo_url: str) -> tuple:
-    """Extract owner and repo name from GitHub URL"""
-    try:
-        # Handle different GitHub URL formats
-        if repo_url.startswith("https://github.com/"):
-            path = repo_url.replace("https://github.com/", "")
-        elif repo_url.startswith("git@github.com:"):
-            path = repo_url.replace("git@github.com:", "")
-        else:
-            raise ValueError("Invalid GitHub URL format")
-        
-        # Remove .git suffix if present
-        if path.endswith(".git"):
-            path = path[:-4]
-        
-        parts = path.split("/")
-        if len(parts) != 2:
-            raise ValueError("Invalid repository path")
-        
-        return parts[0], parts[1]  # owner, repo
-    except Exception as e:
-        raise ValueError(f"Could not parse repository URL: {str(e)}")
-
-def create_github_pull_request(repo_url: str, token: str, branch: str, base_branch: str, 
-                              title: str, body: str) -> dict:
-    """Create a pull request using GitHub API"""
-    try:
-        owner, repo = extract_repo_info(repo_url)
-        
-        # GitHub API endpoint for creating pull requests
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
-        
-        headers = {
-            "Authorization": f"token {token}",
-            "Accept": "application/vnd.github.v3+json",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "title": title,
-            "head": branch,
-            "base": base_branch,
-            "body": body
-        }
-        
-        response = requests.post(api_url, headers=headers, json=data)
-        
-        if response.status_code == 201:
-            pr_data = response.json()
-            return {
-                "success": True,
-                "pr_url": pr_data["html_url"],
-                "pr_number": pr_data["number"],
-                "message": "Pull request created successfully"
-            }
-        else:
-            error_msg = response.json().get("message", "Unknown error")
-            return {
-                "success": False,
-                "message": f"Failed to create PR: {error_msg}"
-            }
-            
-    except Exception as e:
-        return {
-            "success": False,
-            "message": f"Error creating pull request: {str(e)}"
-        }
-
-def get_default_branch(repo_url: str, token: str) -> str:
-    """Get the default branch of the repository"""
-    try:
-        owner, repo = extract_repo_info(repo_url)
-        api_url = f"https://api.github.com/repos/{owner}/{repo}"
-        
-        headers = {
-            "Authorization": f"token {token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
-        response = requests.get(api_url, headers=headers)
-        
-        if response.status_code == 200:
-            repo_data = response.json()
-            return repo_data.get("default_branch", "main")
-        else:
-            return "main"  # fallback
-            
-    except Exception:
-        return "main"  # fallback
-
-# ────────────────── /analyze ──────────────────
-# Update your analyze endpoint in gitpal.py
-
-@router.post("")
-def analyze_repo(request: AnalyzeRequest):
-    temp_dir = None
-    try:
-        # Create temporary directory for cloning
-        temp_dir = tempfile.mkdtemp()
-        print(f"Created temporary directory: {temp_dir}")
-        
-        # Clone repository
-        repo_url = request.repo_url.replace("https://", f"https://{request.token}@")
-        print(f"Cloning repository: {request.repo_url}")
-        
-        repo = Repo.clone_from(repo_url, temp_dir)
-        print(f"Repository cloned successfully to: {temp_dir}")
-        
-        # Verify the repository was cloned successfully
-        if not os.path.exists(temp_dir) or not os.path.exists(os.path.join(temp_dir, '.git')):
-            raise Exception("Repository cloning failed - .git directory not found")
-        
-        # List some files to verify the clone worked
-        files_in_repo = []
-        for root, dirs, files in os.walk(temp_dir):
-            # Skip .git directory
-            if '.git' in dirs:
-                dirs.remove('.git')
-            for file in files:
-                if file.endswith(('.py', '.js', '.ts', '.java', '.cpp', '.c')):  # Add your target file types
-                    rel_path = os.path.relpath(os.path.join(root, file), temp_dir)
-                    files_in_repo.append(rel_path)
-        
-        print(f"Found {len(files_in_repo)} source files in repository")
-        if len(files_in_repo) == 0:
-            print("Warning: No source files found in repository")
-        
-        # Run linter ONLY on the cloned repository
-        print("Running linter on cloned repository...")
-        output = run_linter(temp_dir)
-        
-        if not output.strip():
-            print("Warning: Linter returned empty output")
-            return {
-                "success": True,
-                "message": "Analysis completed - no issues found.",
-                "smell_patterns": [],
-                "total_issues": 0,
-                "repo_path": temp_dir,
-            }
-        
-        # Parse issues and ensure they're all from repository files
-        print("Parsing linter output...")
-        smell_issues = parse_linter_output(output, temp_dir)
-        
-        # Filter out any invalid issues
-        valid_issues = []
-        for issue in smell_issues:
-            if 'error' in issue:
-                print(f"Error in issue: {issue['error']}")
-                continue
-                
-            # Verify the file path is in the repository
-            if 'file_path' in issue and issue['file_path'].startswith(temp_dir):
-                valid_issues.append(issue)
-            else:
-                print(f"Skipping invalid issue: {issue}")
-        
-        print(f"Analysis complete: {len(valid_issues)} valid issues found")
-        
-        return {
-            "success": True,
-            "message": "Analysis completed.",
-            "smell_patterns": valid_issues,
-            "total_issues": len(valid_issues),
-            "repo_path": temp_dir,
-        }
-        
-    except Exception as e:
-        error_msg = f"Analysis failed: {str(e)}"
-        print(error_msg)
-        
-        # Clean up temp directory on error
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            except:
-                pass
-                
-        raise HTTPException(status_code=500, detail=error_msg)
-    try:
-        temp_dir = tempfile.mkdtemp()
-        repo_url = request.repo_url.replace("https://", f"https://{request.token}@")
-        Repo.clone_from(repo_url, temp_dir)
-
-        output = run_linter(temp_dir)
-        smell_issues = parse_linter_output(output, temp_dir)  # adds display_path + code
-
-        return {
-            "success": True,
-            "message": "Analysis completed.",
-            "smell_patterns": smell_issues,
-            "total_issues": len(smell_issues),
-            "repo_path": temp_dir,
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# ────────────────── /preview-fix ──────────────────
-@router.post("/preview-fix", response_model=PreviewResponse)
-def preview_fix(req: FixRequest):
-    if not os.path.exists(req.file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    original_code = open(req.file_path, "r").read()
-    preview_code = fix_code_with_gemini(
-        req.file_path, req.smell_code, req.line_number, save=False
-    )
-
-    return {
-        "success": True,
-        "message": "Preview generated.",
-        "file_path": req.file_path,
-        "original": original_code,
-        "preview_code": preview_code,
-    }
-
-# ────────────────── /generate-fix ──────────────────
-@router.post("/generate-fix")
-def generate_fix(req: FixRequest):
-    if not os.path.exists(req.file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    fixed = fix_code_with_gemini(req.file_path, req.smell_code, req.line_number, save=True)
-    if not fixed or fixed.startswith("Error"):
-        raise HTTPException(status_code=500, detail="Failed to generate fix")
-
-    return {
-        "success": True,
-        "message": "Fix applied.",
-        "file_path": req.file_path,
-        "fix": fixed,
-    }
-
-# ────────────────── /fix-all (unchanged) ──────────────────
-@router.post("/fix-all")
-def fix_all(req: AnalyzeRequest):
-    try:
-        temp_dir = tempfile.mkdtemp()
-        repo = Repo.clone_from(
-            req.repo_url.replace("https://", f"https://{req.token}@"), temp_dir
-        )
-
-        output = run_linter(temp_dir)
-        issues = parse_linter_output(output, temp_dir)
-
-        fixed, skipped = [], []
-        for iss in issues:
-            try:
-                code = fix_code_with_gemini(
-                    iss["file_path"], iss["code"], iss["line_number"], save=True
-                )
-                fixed.append({**iss, "fix": code})
-            except Exception as e:
-                skipped.append({**iss, "error": str(e)})
-
-        return {
-            "success": True,
-            "message": "Auto‑fix complete.",
-            "fixed_issues": fixed,
-            "skipped_issues": skipped,
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# ────────────────── /get-file-content ──────────────────
-@router.post("/get-file-content")
-def get_file_content(req: FileRequest):
-    if not os.path.exists(req.file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    try:
-        with open(req.file_path, "r") as f:
-            return {"content": f.read()}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# ────────────────── /commit-fixes (Enhanced) ──────────────────
-@router.post("/commit-fixes", response_model=PullRequestResponse)
-def commit_fixes(req: CommitFixesRequest):
-    """
-    Enhanced commit-fixes endpoint with pull request support.
-    The frontend sends a list of {file_path (relative), fixed_code}.
-    We rewrite those files in a fresh clone, commit, and optionally create a PR.
-    """
-    temp_dir = tempfile.mkdtemp()
-    try:
-        # Validate input
-        if not req.fixes:
-            raise HTTPException(status_code=400, detail="No fixes provided")
-        
-        # Clean and validate repo URL
-        if not req.repo_url or not req.token:
-            raise HTTPException(status_code=400, detail="Missing repo URL or token")
-        
-        # Get default branch if not specified
-        if not req.base_branch:
-            req.base_branch = get_default_branch(req.repo_url, req.token)
-        
-        # Clone repository
-        repo_url = req.repo_url.replace("https://", f"https://{req.token}@")
-        try:
-            repo = Repo.clone_from(repo_url, temp_dir)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to clone repository: {str(e)}")
-
-        # Process each fix
-        files_written = 0
-        for fx in req.fixes:
-            try:
-                # Clean the file path - remove any temp directory prefixes
-                clean_path = fx.file_path
-                if '/tmp/' in clean_path:
-                    # Extract the relative path after the temp directory
-                    parts = clean_path.split('/')
-                    if len(parts) > 1:
-                        # Find the index where the actual repo content starts
-                        start_idx = -1
-                        for i, part in enumerate(parts):
-                            if part and not part.startswith('tmp') and part != '':
-                                start_idx = i
-                                break
-                        if start_idx > 0:
-                            clean_path = '/'.join(parts[start_idx:])
-                
-                # Ensure the path doesn't start with /
-                clean_path = clean_path.lstrip('/')
-                
-                # Create absolute path in the new clone
-                abs_path = os.path.join(temp_dir, clean_path)
-                
-                # Ensure directory exists
-                os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-                
-                # Write the fixed code
-                with open(abs_path, "w", encoding='utf-8') as f:
-                    f.write(fx.fixed_code)
-                
-                files_written += 1
-                
-            except Exception as e:
-                print(f"Error processing file {fx.file_path}: {str(e)}")
-                # Continue with other files instead of failing completely
-                continue
-
-        if files_written == 0:
-            raise HTTPException(status_code=400, detail="No files could be written")
-
-        # Check if there are actual changes
-        if not repo.is_dirty():
-            raise HTTPException(status_code=400, detail="No changes detected in repository")
-
-        # Create and switch to new branch
-        branch_name = f"gitpal-fixes-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
-        try:
-            repo.git.checkout("-b", branch_name)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to create branch: {str(e)}")
-
-        # Add all changes
-        try:
-            repo.git.add(all=True)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to add changes: {str(e)}")
-
-        # Commit changes
-        try:
-            bot = Actor("GitPal Bot", "bot@gitpal.dev")
-            commit_message = f"🤖 Apply {files_written} code fixes via GitPal"
-            repo.index.commit(commit_message, author=bot, committer=bot)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to commit changes: {str(e)}")
-
-        # Push to remote
-        try:
-            origin = repo.remote(name="origin")
-            origin.push(branch_name)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to push branch: {str(e)}")
-
-        # Create pull request if requested
-        pr_url = None
-        pr_number = None
-        response_message = f"Successfully committed {files_written} fixes and pushed to branch {branch_name}"
-        
-        if req.create_pr:
-            # Set default PR title and body if not provided
-            pr_title = req.pr_title or f"🤖 GitPal: Fix {files_written} code smell{'s' if files_written > 1 else ''}"
-            pr_body = req.pr_body or f"""## 🤖 GitPal Automated Code Fixes
-
-This pull request contains automated fixes for {files_written} code smell{'s' if files_written > 1 else ''} detected by GitPal.
-
-### Changes Made:
-- Applied {files_written} automated fix{'es' if files_written > 1 else ''}
-- Improved code quality and maintainability
-- Fixed various code smells and anti-patterns
-
-### Review Notes:
-- All fixes were generated using AI-powered analysis
-- Please review the changes before merging
-- Consider running your test suite to ensure nothing is broken
-
----
-*This PR was automatically generated by GitPal 🤖*"""
-
-            pr_result = create_github_pull_request(
-                req.repo_url, req.token, branch_name, req.base_branch, pr_title, pr_body
-            )
-            
-            if pr_result["success"]:
-                pr_url = pr_result["pr_url"]
-                pr_number = pr_result["pr_number"]
-                response_message += f" and created pull request #{pr_number}"
-            else:
-                response_message += f" but failed to create PR: {pr_result['message']}"
-
-        return PullRequestResponse(
-            success=True,
-            branch=branch_name,
-            files_changed=files_written,
-            message=response_message,
-            pr_url=pr_url,
-            pr_number=pr_number
-        )
-
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except Exception as e:
-        # Catch any other unexpected errors
-        print(f"Unexpected error in commit_fixes: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    finally:
-        # Always cleanup temp directory
-        try:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        except:
-            pass
-
-# ────────────────── /get-repo-info ──────────────────
-@router.post("/get-repo-info")
-def get_repo_info(request: AnalyzeRequest):
-    """Get repository information including default branch"""
-    try:
-        default_branch = get_default_branch(request.repo_url, request.token)
-        owner, repo = extract_repo_info(request.repo_url)
-        
-        return {
-            "success": True,
-            "owner": owner,
-            "repo": repo,
-            "default_branch": default_branch,
-        }
-    except Exception as e:
+# app/api/gitpal.py
+import logging
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+import os, shutil, tempfile, re
+import functools, hashlib
+import io, tarfile
+import httpx
+from cachetools import TTLCache
+from datetime import datetime
+from diskcache import Cache
+from git import Repo, Actor
+from pathlib import Path
+from urllib.parse import urlparse
+
+import asyncio
+from anyio import CapacityLimiter, to_thread
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.linter import lint_repo_async
+from app.gemini_fix import fix_code_with_gemini, fix_file_with_gemini   # must support save flag
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+router = APIRouter()
+
+# Clone options: the linter only inspects the latest working tree, so skip
+# history, extra branches and tags entirely.
+SHALLOW_CLONE_OPTIONS = ["--depth=1", "--single-branch", "--no-tags", "--filter=blob:none"]
+
+# Clones/pushes run on their own capacity limiter so a burst of them cannot
+# eat the whole starlette threadpool and starve unrelated endpoints.
+_CLONE_LIMITER = CapacityLimiter(4)
+
+SOURCE_EXTS = ('.py', '.js', '.ts', '.java', '.cpp', '.c')  # Add your target file types
+
+# Cap on Gemini calls in flight per /fix-all request
+_MAX_CONCURRENT_FIXES = 8
+
+# Finished analyses keyed by owner/repo@HEAD-sha: polling an unchanged repo
+# skips the whole snapshot+lint pipeline. repo_path in a cached response stays
+# valid as long as the snapshot directory survives on disk.
+_ANALYSIS_CACHE_TTL = 24 * 3600
+_CACHE_ROOT = os.getenv("GITPAL_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "gitpal-cache"
+)
+_analysis_cache = Cache(os.path.join(_CACHE_ROOT, "analysis"))
+
+# Shared client so GitHub calls reuse one keepalive/HTTP2 connection pool
+# instead of paying a fresh TCP+TLS handshake per request.
+_gh = httpx.Client(
+    base_url="https://api.github.com",
+    http2=True,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=32),
+)
+
+# ────────────────── Pydantic models ──────────────────
+class AnalyzeRequest(BaseModel):
+    repo_url: str
+    token: str
+    # Optional diff-derived file list: when set, only these files are linted
+    files: Optional[List[str]] = None
+
+class FixRequest(BaseModel):
+    file_path: str          # full temp path received from frontend
+    smell_code: str
+    line_number: int
+
+class PreviewResponse(BaseModel):
+    success: bool
+    message: str
+    file_path: str
+    original: str
+    preview_code: str
+
+class FileRequest(BaseModel):
+    file_path: str          # path the frontend wants to read
+
+class SingleFix(BaseModel):
+    file_path: str          # **relative** path inside repo (frontend sends display_path)
+    fixed_code: str
+
+class CommitFixesRequest(BaseModel):
+    repo_url: str
+    token: str
+    fixes: List[SingleFix]
+    create_pr: Optional[bool] = False  # New field to indicate if PR should be created
+    pr_title: Optional[str] = None
+    pr_body: Optional[str] = None
+    base_branch: Optional[str] = "main"  # Default base branch
+
+class PullRequestResponse(BaseModel):
+    success: bool
+    branch: str
+    files_changed: int
+    message: str
+    pr_url: Optional[str] = None
+    pr_number: Optional[int] = None
+
+# ────────────────── Helper Functions ──────────────────
+def _iter_sources(root: str, exts: tuple):
+    """Yield paths of source files under root, skipping .git.
+
+    Uses os.scandir so the file/dir type comes straight from readdir instead
+    of costing an extra stat per entry like os.walk does.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.name == ".git":
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(exts):
+                    yield entry.path
+
+
+# Matches the /tmp/<clone-dir>/ (or macOS /var/folders/...) prefix the
+# frontend may echo back in fix paths. Anchored on a leading slash so a
+# repo's own relative tmp/... paths are left untouched.
+_TMP_PREFIX_RE = re.compile(r"^/(?:tmp|var/folders/[^/]+/[^/]+)/[^/]+/")
+
+
+class _ResponseReader(io.RawIOBase):
+    """File-like adapter over a streaming httpx response body."""
+
+    def __init__(self, resp):
+        self._chunks = resp.iter_bytes()
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _snapshot_repo(owner: str, repo: str, token: str, ref: Optional[str], dest: str) -> None:
+    """
+    Stream the GitHub tarball of `ref` into dest, keeping only source files.
+
+    The linter only needs a working-tree snapshot, so this skips git's
+    pack/delta resolution and the .git directory entirely.
+    """
+    url = f"/repos/{owner}/{repo}/tarball/{ref}" if ref else f"/repos/{owner}/{repo}/tarball"
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    with _gh.stream("GET", url, headers=headers, follow_redirects=True) as resp:
+        resp.raise_for_status()
+        # r|gz reads strictly forward, decompressing chunks as they arrive
+        with tarfile.open(fileobj=io.BufferedReader(_ResponseReader(resp)), mode="r|gz") as tar:
+            while (member := tar.next()) is not None:
+                # Entries are prefixed with "<owner>-<repo>-<sha>/"
+                parts = member.name.split("/", 1)
+                if len(parts) != 2 or not member.isfile() or not parts[1].endswith(SOURCE_EXTS):
+                    continue
+                target = os.path.join(dest, parts[1])
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as src, open(target, "wb") as out:
+                    shutil.copyfileobj(src, out)
+
+
+def _clean_fix_path(file_path: str) -> str:
+    """Strip any /tmp/<clone-dir> prefix the frontend may have echoed back."""
+    clean_path = _TMP_PREFIX_RE.sub("", file_path, count=1).lstrip('/')
+    # Collapse any ../ segments so a fix path can never escape the clone
+    clean_path = os.path.normpath(clean_path)
+    while clean_path.startswith('../'):
+        clean_path = clean_path[3:]
+    return clean_path
+
+
+def _auth_git_env(token: str) -> dict:
+    """Environment-injected git config that authenticates over a header
+    instead of rewriting the clone URL. Keeps the token out of remotes,
+    .git/config, logs and process argv, and sidesteps GitPython's
+    unsafe-option guard on -c in multi_options."""
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Bearer {token}",
+    }
+
+
+def _scrub_token(message: str, token: str) -> str:
+    """Make sure a git error can never echo the token back to the caller."""
+    return message.replace(token, "***") if token else message
+
+
+def _write_fix(abs_path: str, fixed_code: str) -> bool:
+    """Write one fixed file; returns False instead of raising so one bad fix
+    doesn't sink the whole batch."""
+    try:
+        Path(abs_path).write_text(fixed_code, encoding='utf-8')
+        return True
+    except Exception as e:
+        logger.warning("Error writing file %s: %s", abs_path, e)
+        return False
+
+
+@functools.lru_cache(maxsize=256)
+def _read_text_at(path: str, mtime_ns: int) -> str:
+    return Path(path).read_text(encoding="utf-8", errors="replace")
+
+
+def read_file_text(path: str) -> str:
+    """Read a file, reusing the cached copy while its mtime is unchanged."""
+    return _read_text_at(path, os.stat(path).st_mtime_ns)
+
+
+# Accepts https://github.com/owner/repo(.git) and git@github.com:owner/repo(.git)
+_REPO_URL_RE = re.compile(
+    r"^(?:https://github\.com/|git@github\.com:)([^/]+)/([^/]+?)(?:\.git)?/?$"
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def extract_repo_info(repo_url: str) -> tuple:
+    """Extract owner and repo name from GitHub URL"""
+    m = _REPO_URL_RE.match(repo_url)
+    if not m:
+        raise ValueError(f"Could not parse repository URL: {repo_url}")
+    return m.group(1), m.group(2)  # owner, repo
+
+def create_github_pull_request(repo_url: str, token: str, branch: str, base_branch: str, 
+                              title: str, body: str) -> dict:
+    """Create a pull request using GitHub API"""
+    try:
+        owner, repo = extract_repo_info(repo_url)
+
+        headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+            "Content-Type": "application/json"
+        }
+
+        data = {
+            "title": title,
+            "head": branch,
+            "base": base_branch,
+            "body": body
+        }
+
+        response = _gh.post(f"/repos/{owner}/{repo}/pulls", headers=headers, json=data)
+        
+        if response.status_code == 201:
+            pr_data = response.json()
+            return {
+                "success": True,
+                "pr_url": pr_data["html_url"],
+                "pr_number": pr_data["number"],
+                "message": "Pull request created successfully"
+            }
+        else:
+            error_msg = response.json().get("message", "Unknown error")
+            return {
+                "success": False,
+                "message": f"Failed to create PR: {error_msg}"
+            }
+            
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error creating pull request: {str(e)}"
+        }
+
+# Repo metadata barely changes between calls, so keep fresh responses for a
+# short TTL and remember ETags so refreshes can be answered with a free 304.
+_repo_cache = TTLCache(maxsize=1024, ttl=60)
+_repo_etags: dict = {}
+
+
+def _token_hash(token: str) -> str:
+    """Short digest so cache keys never retain the raw token."""
+    return hashlib.blake2b(token.encode(), digest_size=8).hexdigest()
+
+
+def _get_repo_data(repo_url: str, token: str) -> dict:
+    """Fetch /repos/{owner}/{repo}, using the TTL cache and conditional requests"""
+    owner, repo = extract_repo_info(repo_url)
+    key = (owner, repo, _token_hash(token))
+
+    cached = _repo_cache.get(key)
+    if cached is not None:
+        return cached
+
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    etag_entry = _repo_etags.get(key)
+    if etag_entry:
+        # Conditional request: a 304 reply costs no rate-limit token
+        headers["If-None-Match"] = etag_entry[0]
+
+    response = _gh.get(f"/repos/{owner}/{repo}", headers=headers)
+
+    if response.status_code == 304 and etag_entry:
+        repo_data = etag_entry[1]
+        _repo_cache[key] = repo_data
+        return repo_data
+
+    if response.status_code == 200:
+        repo_data = response.json()
+        _repo_cache[key] = repo_data
+        etag = response.headers.get("ETag")
+        if etag:
+            _repo_etags[key] = (etag, repo_data)
+        return repo_data
+
+    raise ValueError(f"GitHub API returned {response.status_code} for {owner}/{repo}")
+
+
+def _get_head_sha(owner: str, repo: str, token: str) -> Optional[str]:
+    """HEAD commit sha of the default branch, or None if the lookup fails."""
+    try:
+        headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        response = _gh.get(f"/repos/{owner}/{repo}/commits/HEAD", headers=headers)
+        if response.status_code == 200:
+            return response.json().get("sha")
+    except Exception:
+        pass
+    return None
+
+
+def get_default_branch(repo_url: str, token: str) -> str:
+    """Get the default branch of the repository"""
+    try:
+        repo_data = _get_repo_data(repo_url, token)
+        return repo_data.get("default_branch", "main")
+    except Exception:
+        return "main"  # fallback
+
+# ────────────────── /analyze ──────────────────
+# Update your analyze endpoint in gitpal.py
+
+@router.post("")
+async def analyze_repo(request: AnalyzeRequest):
+    temp_dir = None
+    try:
+        owner, repo_name = extract_repo_info(request.repo_url)
+
+        # One cheap HEAD lookup: if we already linted this exact commit and
+        # the snapshot is still on disk, skip the snapshot+lint pipeline
+        head_sha = await to_thread.run_sync(_get_head_sha, owner, repo_name, request.token)
+        # A targeted file list is a different (partial) analysis — key it apart
+        # from full-repo runs at the same commit
+        files_tag = ""
+        if request.files:
+            files_tag = ":" + hashlib.blake2b(
+                "\0".join(sorted(request.files)).encode(), digest_size=8
+            ).hexdigest()
+        cache_key = f"{owner}/{repo_name}@{head_sha}{files_tag}" if head_sha else None
+        if cache_key:
+            cached = _analysis_cache.get(cache_key)
+            if cached is not None and os.path.isdir(cached["repo_path"]):
+                logger.info("Serving cached analysis for %s", cache_key)
+                return cached
+
+        # Create temporary directory for the snapshot
+        temp_dir = tempfile.mkdtemp()
+        logger.debug("Created temporary directory: %s", temp_dir)
+
+        # Snapshot the repository: stream GitHub's tarball instead of cloning —
+        # the linter only reads files, it never needs history or .git
+        logger.info("Snapshotting repository: %s", request.repo_url)
+
+        await to_thread.run_sync(
+            functools.partial(_snapshot_repo, owner, repo_name, request.token, None, temp_dir),
+            limiter=_CLONE_LIMITER,
+        )
+        logger.debug("Repository snapshot written to: %s", temp_dir)
+
+        # List some files to verify the snapshot worked
+        files_in_repo = [
+            os.path.relpath(path, temp_dir)
+            for path in _iter_sources(temp_dir, SOURCE_EXTS)
+        ]
+        
+        logger.debug("Found %d source files in repository", len(files_in_repo))
+        if len(files_in_repo) == 0:
+            logger.warning("No source files found in repository")
+        
+        # Run linter ONLY on the cloned repository
+        logger.info("Running linter on cloned repository...")
+        smell_issues = await lint_repo_async(temp_dir, request.files)
+
+        if not smell_issues:
+            logger.info("Linter returned no issues")
+            result = {
+                "success": True,
+                "message": "Analysis completed - no issues found.",
+                "smell_patterns": [],
+                "total_issues": 0,
+                "repo_path": temp_dir,
+            }
+            if cache_key:
+                _analysis_cache.set(cache_key, result, expire=_ANALYSIS_CACHE_TTL)
+            return result
+        
+        # Filter out any invalid issues
+        valid_issues = []
+        for issue in smell_issues:
+            if 'error' in issue:
+                logger.debug("Error in issue: %s", issue['error'])
+                continue
+                
+            # Verify the file path is in the repository
+            if 'file_path' in issue and issue['file_path'].startswith(temp_dir):
+                valid_issues.append(issue)
+            else:
+                logger.debug("Skipping invalid issue: %s", issue)
+        
+        logger.info("Analysis complete: %d valid issues found", len(valid_issues))
+
+        result = {
+            "success": True,
+            "message": "Analysis completed.",
+            "smell_patterns": valid_issues,
+            "total_issues": len(valid_issues),
+            "repo_path": temp_dir,
+        }
+        if cache_key:
+            _analysis_cache.set(cache_key, result, expire=_ANALYSIS_CACHE_TTL)
+        return result
+        
+    except Exception as e:
+        error_msg = f"Analysis failed: {str(e)}"
+        logger.error(error_msg)
+        
+        # Clean up temp directory on error
+        if temp_dir and os.path.exists(temp_dir):
+            try:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            except:
+                pass
+                
+        raise HTTPException(status_code=500, detail=error_msg)
+
+# ────────────────── /preview-fix ──────────────────
+@router.post("/preview-fix", response_model=PreviewResponse)
+async def preview_fix(req: FixRequest):
+    if not os.path.exists(req.file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    original_code = read_file_text(req.file_path)
+    preview_code = await fix_code_with_gemini(
+        req.file_path, req.smell_code, req.line_number, save=False
+    )
+
+    return {
+        "success": True,
+        "message": "Preview generated.",
+        "file_path": req.file_path,
+        "original": original_code,
+        "preview_code": preview_code,
+    }
+
+# ────────────────── /generate-fix ──────────────────
+@router.post("/generate-fix")
+async def generate_fix(req: FixRequest):
+    if not os.path.exists(req.file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    fixed = await fix_code_with_gemini(req.file_path, req.smell_code, req.line_number, save=True)
+    if not fixed or fixed.startswith("Error"):
+        raise HTTPException(status_code=500, detail="Failed to generate fix")
+
+    return {
+        "success": True,
+        "message": "Fix applied.",
+        "file_path": req.file_path,
+        "fix": fixed,
+    }
+
+# ────────────────── /fix-all (unchanged) ──────────────────
+@router.post("/fix-all")
+async def fix_all(req: AnalyzeRequest):
+    try:
+        temp_dir = tempfile.mkdtemp()
+        repo = await to_thread.run_sync(
+            functools.partial(
+                Repo.clone_from,
+                req.repo_url,
+                temp_dir,
+                multi_options=SHALLOW_CLONE_OPTIONS,
+                env=_auth_git_env(req.token),
+            ),
+            limiter=_CLONE_LIMITER,
+        )
+
+        issues = await lint_repo_async(temp_dir, req.files)
+
+        # One Gemini call per *file* (not per issue), files fixed concurrently
+        # on the event loop — the work is I/O bound on the Gemini RPC.
+        by_file = defaultdict(list)
+        for iss in issues:
+            by_file[iss["file_path"]].append(iss)
+
+        # Bounded fan-out: at most _MAX_CONCURRENT_FIXES RPCs in flight, so a
+        # repo with issues in hundreds of files can't trip API rate limits
+        sem = asyncio.Semaphore(_MAX_CONCURRENT_FIXES)
+
+        async def _fix_bounded(path, file_issues):
+            async with sem:
+                return await fix_file_with_gemini(path, file_issues, save=True)
+
+        results = await asyncio.gather(
+            *(
+                _fix_bounded(path, file_issues)
+                for path, file_issues in by_file.items()
+            ),
+            return_exceptions=True,
+        )
+
+        fixed, skipped = [], []
+        for file_issues, result in zip(by_file.values(), results):
+            if isinstance(result, Exception):
+                skipped.extend({**iss, "error": str(result)} for iss in file_issues)
+            else:
+                fixed.extend({**iss, "fix": result} for iss in file_issues)
+
+        return {
+            "success": True,
+            "message": "Auto‑fix complete.",
+            "fixed_issues": fixed,
+            "skipped_issues": skipped,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ────────────────── /get-file-content ──────────────────
+@router.post("/get-file-content")
+async def get_file_content(req: FileRequest):
+    if not os.path.exists(req.file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        return {"content": read_file_text(req.file_path)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ────────────────── /commit-fixes (Enhanced) ──────────────────
+@router.post("/commit-fixes", response_model=PullRequestResponse)
+async def commit_fixes(req: CommitFixesRequest):
+    """
+    Enhanced commit-fixes endpoint with pull request support.
+    The frontend sends a list of {file_path (relative), fixed_code}.
+    We rewrite those files in a fresh clone, commit, and optionally create a PR.
+    """
+    temp_dir = None
+    try:
+        # Validate input
+        if not req.fixes:
+            raise HTTPException(status_code=400, detail="No fixes provided")
+
+        # Clean and validate repo URL
+        if not req.repo_url or not req.token:
+            raise HTTPException(status_code=400, detail="Missing repo URL or token")
+
+        # Get default branch if not specified
+        if not req.base_branch:
+            req.base_branch = await to_thread.run_sync(get_default_branch, req.repo_url, req.token)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # Shallow clone of just the base branch: we only need its tip to
+            # commit on top of, and the push below creates a brand-new branch.
+            repo = await to_thread.run_sync(
+                functools.partial(
+                    Repo.clone_from,
+                    req.repo_url,
+                    temp_dir,
+                    branch=req.base_branch,
+                    multi_options=["--depth=1", "--no-tags"],
+                    env=_auth_git_env(req.token),
+                ),
+                limiter=_CLONE_LIMITER,
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Failed to clone repository: {_scrub_token(str(e), req.token)}",
+            )
+
+        # Resolve target paths up front and create each parent directory once
+        targets = [
+            (os.path.join(temp_dir, _clean_fix_path(fx.file_path)), fx.fixed_code)
+            for fx in req.fixes
+        ]
+        for parent in {os.path.dirname(abs_path) for abs_path, _ in targets}:
+            os.makedirs(parent, exist_ok=True)
+
+        # Write fixes in parallel — the writes release the GIL and the kernel
+        # coalesces I/O on the same directories
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            write_results = list(pool.map(lambda t: _write_fix(*t), targets))
+
+        # We know exactly which files changed, so stage just those instead of
+        # letting git stat the whole work tree via add(all=True)
+        changed_paths = [
+            os.path.relpath(abs_path, temp_dir)
+            for (abs_path, _), written in zip(targets, write_results)
+            if written
+        ]
+        files_written = len(changed_paths)
+
+        if files_written == 0:
+            raise HTTPException(status_code=400, detail="No files could be written")
+
+        # Create and switch to new branch
+        branch_name = f"gitpal-fixes-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
+        try:
+            repo.git.checkout("-b", branch_name)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to create branch: {str(e)}")
+
+        # Stage only the files we just wrote
+        try:
+            repo.index.add(changed_paths)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to add changes: {str(e)}")
+
+        # A fix identical to what is on disk still "writes" fine, so check the
+        # staged diff — never push an empty commit and a content-free PR
+        if not repo.index.diff("HEAD"):
+            raise HTTPException(status_code=400, detail="No changes detected")
+
+        # Commit changes
+        try:
+            bot = Actor("GitPal Bot", "bot@gitpal.dev")
+            commit_message = f"🤖 Apply {files_written} code fixes via GitPal"
+            repo.index.commit(commit_message, author=bot, committer=bot)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to commit changes: {str(e)}")
+
+        # Push to remote
+        try:
+            origin = repo.remote(name="origin")
+            # The push needs the same header auth as the clone, injected for
+            # just this command instead of written into .git/config
+            with repo.git.custom_environment(**_auth_git_env(req.token)):
+                await to_thread.run_sync(
+                    functools.partial(origin.push, branch_name, force_with_lease=True),
+                    limiter=_CLONE_LIMITER,
+                )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to push branch: {_scrub_token(str(e), req.token)}",
+            )
+
+        # Create pull request if requested
+        pr_url = None
+        pr_number = None
+        response_message = f"Successfully committed {files_written} fixes and pushed to branch {branch_name}"
+        
+        if req.create_pr:
+            # Set default PR title and body if not provided
+            pr_title = req.pr_title or f"🤖 GitPal: Fix {files_written} code smell{'s' if files_written > 1 else ''}"
+            pr_body = req.pr_body or f"""## 🤖 GitPal Automated Code Fixes
+
+This pull request contains automated fixes for {files_written} code smell{'s' if files_written > 1 else ''} detected by GitPal.
+
+### Changes Made:
+- Applied {files_written} automated fix{'es' if files_written > 1 else ''}
+- Improved code quality and maintainability
+- Fixed various code smells and anti-patterns
+
+### Review Notes:
+- All fixes were generated using AI-powered analysis
+- Please review the changes before merging
+- Consider running your test suite to ensure nothing is broken
+
+---
+*This PR was automatically generated by GitPal 🤖*"""
+
+            pr_result = await to_thread.run_sync(
+                create_github_pull_request,
+                req.repo_url, req.token, branch_name, req.base_branch, pr_title, pr_body,
+            )
+            
+            if pr_result["success"]:
+                pr_url = pr_result["pr_url"]
+                pr_number = pr_result["pr_number"]
+                response_message += f" and created pull request #{pr_number}"
+            else:
+                response_message += f" but failed to create PR: {pr_result['message']}"
+
+        return PullRequestResponse(
+            success=True,
+            branch=branch_name,
+            files_changed=files_written,
+            message=response_message,
+            pr_url=pr_url,
+            pr_number=pr_number
+        )
+
+    except HTTPException:
+        # Re-raise HTTP exceptions as-is
+        raise
+    except Exception as e:
+        # Catch any other unexpected errors
+        logger.error("Unexpected error in commit_fixes: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        # Clean up temp directory
+        if temp_dir:
+            try:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            except:
+                pass
+
+# ────────────────── /get-repo-info ──────────────────
+@router.post("/get-repo-info")
+async def get_repo_info(request: AnalyzeRequest):
+    """Get repository information including default branch"""
+    try:
+        default_branch = await to_thread.run_sync(get_default_branch, request.repo_url, request.token)
+        owner, repo = extract_repo_info(request.repo_url)
+        
+        return {
+            "success": True,
+            "owner": owner,
+            "repo": repo,
+            "default_branch": default_branch,
+        }
+    except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
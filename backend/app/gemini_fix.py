@@ -1,131 +1,252 @@
-import os
-from google import genai
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-fix_cache: dict[tuple[str, str, int], str] = {}
-client = genai.Client()
-
-
-# ---------- helpers --------------------------------------------------------- #
-def _extract_text(blob) -> str:
-    """
-    Turn a Gemini Content/Part (or plain str) into pure text.
-    """
-    if isinstance(blob, str):
-        return blob
-
-    # Gemini ≥ v1 – .text field is present
-    if hasattr(blob, "text") and isinstance(blob.text, str):
-        return blob.text
-
-    # Gemini beta – .parts is a list of Part objects
-    if hasattr(blob, "parts"):
-        return "".join(
-            p.text if hasattr(p, "text") else str(p)         # join all parts
-            for p in blob.parts
-        )
-
-    # Fallback – string‑ify whatever it is
-    return str(blob)
-
-
-def clean_markdown(raw: str) -> str:
-    """Strip ``` fences and leading/trailing whitespace."""
-    return (
-        raw.replace("```python", "")
-           .replace("```", "")
-           .strip()
-    )
-
-
-# ---------- main entry ------------------------------------------------------ #
-def fix_code_with_gemini(
-    file_path: str,
-    smell_code: str,
-    line_number: int,
-    save: bool = True,
-) -> str:
-    if not GEMINI_API_KEY:
-        raise ValueError("GEMINI_API_KEY env-var is missing")
-
-    # Cache-hit
-    cache_key = (file_path, smell_code, line_number)
-    if cache_key in fix_cache:
-        return fix_cache[cache_key]
-
-    # 1. read file ----------------------------------------------------------- #
-    with open(file_path, "r") as fh:
-        content = fh.read()
-
-    # 2. craft prompt -------------------------------------------------------- #
-    match smell_code:
-        case "C0114":
-            prompt = (
-                "Add a one-liner *module* docstring at the very top.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case "C0115":
-            prompt = (
-                "Add a one-liner *class* docstring.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case "C0301":
-            prompt = (
-                "Refactor any line >100 chars so it complies with PEP-8.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case "C0303":
-            prompt = (
-                "Refactor overly complex lines into simpler constructs.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case "C0411":
-            prompt = (
-                "Move all import statements to the top of the file (PEP-8).\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case "C0412":
-            prompt = (
-                "Replace the wildcard import with explicit names.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case _ if smell_code.startswith("C041") or smell_code == "E0401":
-            prompt = (
-                "Remove or fix any unused / unresolved imports.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case _ if smell_code.startswith("E11"):
-            prompt = (
-                f"Fix the {smell_code} attribute / call error shown below.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case "D0123":
-            prompt = (
-                "Re-format all docstrings to follow PEP-257.\n\n"
-                f'File content:\n"""{content}"""'
-            )
-        case _:
-            raise ValueError(f"Unsupported smell code → {smell_code}")
-
-    # 3. call Gemini --------------------------------------------------------- #
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
-
-    raw_reply = resp.candidates[0].content            # Content object
-    fixed_code = clean_markdown(_extract_text(raw_reply))
-
-    if not fixed_code:
-        raise RuntimeError("Gemini returned empty fix")
-
-    # 4. persist if requested ------------------------------------------------ #
-    if save:
-        with open(file_path, "w") as fh:
-            fh.write(fixed_code)
-        print(f"✅Fix written to {file_path}")
-    else:
-        print(f"👁Preview only for {file_path}")
-
-    fix_cache[cache_key] = fixed_code
-    return fixed_code
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from diskcache import Cache
+from google import genai
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# All persistent caches live under one configurable root; the default is
+# user-writable so an unconfigured install can still boot
+_CACHE_ROOT = os.getenv("GITPAL_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "gitpal-cache"
+)
+
+# Content-addressed cache of generated fixes. Keyed on the file *content*
+# (not its ephemeral /tmp path) so identical files across clones and across
+# server restarts reuse the same Gemini reply instead of a 1-5 s RPC.
+_FIX_CACHE_TTL = 7 * 86400
+fix_cache = Cache(
+    os.path.join(_CACHE_ROOT, "fixes"),
+    size_limit=2**30,  # 1 GB
+)
+client = genai.Client()
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def _fix_cache_key(content: str, smell_code: str, line_number: int | str) -> str:
+    digest = hashlib.blake2b(content.encode()).hexdigest()
+    return f"{digest}:{smell_code}:{line_number}"
+
+
+# Prompt templates precompiled at import: dispatch is a dict hit instead of a
+# linear match-chain with startswith guards. {content}/{smell} are filled in
+# with format_map at call time.
+_PROMPT_SUFFIX = '\n\nFile content:\n"""{content}"""'
+PROMPTS: dict[str, str] = {
+    "C0114": "Add a one-liner *module* docstring at the very top." + _PROMPT_SUFFIX,
+    "C0115": "Add a one-liner *class* docstring." + _PROMPT_SUFFIX,
+    "C0301": "Refactor any line >100 chars so it complies with PEP-8." + _PROMPT_SUFFIX,
+    "C0303": "Refactor overly complex lines into simpler constructs." + _PROMPT_SUFFIX,
+    "C0411": "Move all import statements to the top of the file (PEP-8)." + _PROMPT_SUFFIX,
+    "C0412": "Replace the wildcard import with explicit names." + _PROMPT_SUFFIX,
+    "D0123": "Re-format all docstrings to follow PEP-257." + _PROMPT_SUFFIX,
+    "E0401": "Remove or fix any unused / unresolved imports." + _PROMPT_SUFFIX,
+}
+PREFIX_PROMPTS: dict[str, str] = {
+    "C041": PROMPTS["E0401"],                       # rest of the C041x family
+    "E11": "Fix the {smell} attribute / call error shown below." + _PROMPT_SUFFIX,
+}
+
+
+# Smells that are local to a line: only a window around the offending line is
+# sent to Gemini (plus the module header for import context). Import-shuffling
+# and module-docstring smells still need the whole file.
+_WINDOWED_SMELLS = {"C0115", "C0301", "C0303"}
+_WINDOW_PRE = 30
+_WINDOW_POST = 30
+
+
+def _window(lines: list[str], line_number: int, pre: int = _WINDOW_PRE, post: int = _WINDOW_POST):
+    """Return (snippet, start, end) — 0-based slice bounds around line_number."""
+    start = max(0, line_number - 1 - pre)
+    end = min(len(lines), line_number + post)
+    return "".join(lines[start:end]), start, end
+
+
+def _is_windowed(smell_code: str) -> bool:
+    return smell_code in _WINDOWED_SMELLS or smell_code.startswith("E11")
+
+
+def _build_prompt(smell_code: str, content: str) -> str:
+    template = (
+        PROMPTS.get(smell_code)
+        or PREFIX_PROMPTS.get(smell_code[:4])
+        or PREFIX_PROMPTS.get(smell_code[:3])
+    )
+    if template is None:
+        raise ValueError(f"Unsupported smell code → {smell_code}")
+    return template.format_map({"content": content, "smell": smell_code})
+
+
+# ---------- helpers --------------------------------------------------------- #
+def _extract_text(blob) -> str:
+    """
+    Turn a Gemini Content/Part (or plain str) into pure text.
+    """
+    if isinstance(blob, str):
+        return blob
+
+    # Gemini ≥ v1 – .text field is present
+    if hasattr(blob, "text") and isinstance(blob.text, str):
+        return blob.text
+
+    # Gemini beta – .parts is a list of Part objects
+    if hasattr(blob, "parts"):
+        return "".join(
+            p.text if hasattr(p, "text") else str(p)         # join all parts
+            for p in blob.parts
+        )
+
+    # Fallback – string‑ify whatever it is
+    return str(blob)
+
+
+# Opening fence with any language tag, or a closing fence
+_FENCE_RE = re.compile(r"^``` ?[a-zA-Z]*\n|```\s*$", re.MULTILINE)
+
+
+def clean_markdown(raw: str) -> str:
+    """Strip ``` fences and leading/trailing whitespace."""
+    return _FENCE_RE.sub("", raw).strip()
+
+
+async def _generate_stream(prompt: str) -> str:
+    """
+    Run one Gemini request on the async client, accumulating the streamed
+    chunks. Streaming + async keeps FastAPI workers free during the RPC
+    instead of blocking a thread for the full multi-second call.
+    """
+    parts: list[str] = []
+    # generate_content_stream is a coroutine that resolves to the iterator
+    async for chunk in await client.aio.models.generate_content_stream(
+        model="gemini-2.5-flash",
+        contents=prompt,
+    ):
+        text = getattr(chunk, "text", None)
+        if text:
+            parts.append(text)
+    return clean_markdown("".join(parts))
+
+
+# ---------- main entry ------------------------------------------------------ #
+async def fix_code_with_gemini(
+    file_path: str,
+    smell_code: str,
+    line_number: int,
+    save: bool = True,
+) -> str:
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY env-var is missing")
+
+    # 1. read file ----------------------------------------------------------- #
+    content = Path(file_path).read_text(encoding="utf-8", errors="replace")
+
+    # Cache-hit – same content + smell means the same fix, whatever the path
+    cache_key = _fix_cache_key(content, smell_code, line_number)
+    cached = fix_cache.get(cache_key)
+    if cached is not None:
+        if save:
+            Path(file_path).write_text(cached, encoding="utf-8")
+        return cached
+
+    # 2. craft prompt -------------------------------------------------------- #
+    lines = content.splitlines(keepends=True)
+    window_bounds = None
+    if _is_windowed(smell_code) and len(lines) > _WINDOW_PRE + _WINDOW_POST:
+        # Local smell in a big file: send a span around the line, not the
+        # whole file — input tokens (and Gemini latency) scale with size
+        snippet, start, end = _window(lines, line_number)
+        window_bounds = (start, end)
+        header = "".join(lines[:10]) if start > 10 else ""
+        context = (
+            f'Module header, for import context only (do NOT return it):\n"""{header}"""\n\n'
+            if header else ""
+        )
+        prompt = (
+            context
+            + f"You are given lines {start + 1}-{end} of a larger file. "
+              "Return ONLY the corrected version of these lines, nothing else.\n\n"
+            + _build_prompt(smell_code, snippet)
+        )
+    else:
+        prompt = _build_prompt(smell_code, content)
+
+    # 3. call Gemini --------------------------------------------------------- #
+    fixed_code = await _generate_stream(prompt)
+
+    if not fixed_code:
+        raise RuntimeError("Gemini returned empty fix")
+
+    if window_bounds:
+        # Splice the corrected span back into the untouched remainder
+        start, end = window_bounds
+        if not fixed_code.endswith("\n"):
+            fixed_code += "\n"
+        fixed_code = "".join(lines[:start]) + fixed_code + "".join(lines[end:])
+
+    # 4. persist if requested ------------------------------------------------ #
+    if save:
+        Path(file_path).write_text(fixed_code, encoding="utf-8")
+        logger.debug("Fix written to %s", file_path)
+    else:
+        logger.debug("Preview only for %s", file_path)
+
+    fix_cache.set(cache_key, fixed_code, expire=_FIX_CACHE_TTL)
+    return fixed_code
+
+
+# ---------- batched entry --------------------------------------------------- #
+async def fix_file_with_gemini(
+    file_path: str,
+    issues: list[dict],
+    save: bool = True,
+) -> str:
+    """
+    Fix *all* smells of one file in a single Gemini call.
+
+    One RPC per file instead of one per issue: the file content is uploaded
+    once and Gemini sees every (line, smell) pair together, which is both
+    faster and gives more consistent rewrites.
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY env-var is missing")
+
+    content = Path(file_path).read_text(encoding="utf-8", errors="replace")
+
+    issue_lines = "\n".join(
+        f"- line {iss['line_number']}: {iss['code']} ({iss.get('message', '')})"
+        for iss in issues
+    )
+    # blake2b, not hash(): the key must be stable across processes/restarts
+    # for a persistent cache, and collision-resistant
+    issues_digest = hashlib.blake2b(issue_lines.encode()).hexdigest()
+    cache_key = _fix_cache_key(content, "batch", issues_digest)
+    cached = fix_cache.get(cache_key)
+    if cached is not None:
+        if save:
+            Path(file_path).write_text(cached, encoding="utf-8")
+        return cached
+
+    prompt = (
+        "Fix ALL of the following pylint issues in the file below and "
+        "return the complete corrected file, nothing else.\n\n"
+        f"Issues:\n{issue_lines}\n\n"
+        f'File content:\n"""{content}"""'
+    )
+
+    fixed_code = await _generate_stream(prompt)
+    if not fixed_code:
+        raise RuntimeError("Gemini returned empty fix")
+
+    if save:
+        Path(file_path).write_text(fixed_code, encoding="utf-8")
+        logger.debug("Fix written to %s", file_path)
+
+    fix_cache.set(cache_key, fixed_code, expire=_FIX_CACHE_TTL)
+    return fixed_code
@@ -1,143 +1,427 @@
-import subprocess
-import json
-import os
-from typing import List, Dict
-
-def run_linter(path: str) -> str:
-    """
-    Run pylint on the specific repository path only
-    """
-    try:
-        # Ensure we're working with absolute path
-        abs_path = os.path.abspath(path)
-        
-        # Verify the path exists and is a directory
-        if not os.path.exists(abs_path):
-            raise Exception(f"Path does not exist: {abs_path}")
-        
-        if not os.path.isdir(abs_path):
-            raise Exception(f"Path is not a directory: {abs_path}")
-        
-        # Change to the repository directory to ensure relative paths work correctly
-        original_cwd = os.getcwd()
-        os.chdir(abs_path)
-        
-        print(f"Running pylint on: {abs_path}")
-        print(f"Current working directory: {os.getcwd()}")
-        
-        # Run pylint with specific configurations
-        result = subprocess.run(
-            [
-                "pylint",
-                ".",  # Scan current directory (the cloned repo)
-                "--output-format=json",
-                "--disable=all",
-                "--enable=C0114,C0115,C0301,C0303,C0411,C0412,C0413,C0414,C0415,C0416,D0123,C0417,E0401,E1101,E1102,E1103,E1104,E1105,E1106,E1120,E1121,E1122,E1123",
-                "--ignore=.git,node_modules,__pycache__,.vscode,.idea,venv,env",  # Ignore common non-source directories
-                "--recursive=y"  # Recursively scan subdirectories
-            ],
-            capture_output=True,
-            text=True,
-            cwd=abs_path  # Ensure subprocess runs in the repo directory
-        )
-        
-        # Restore original working directory
-        os.chdir(original_cwd)
-        
-        print(f"Pylint exit code: {result.returncode}")
-        print(f"Pylint stdout length: {len(result.stdout)}")
-        print(f"Pylint stderr: {result.stderr}")
-        
-        return result.stdout
-        
-    except Exception as e:
-        # Restore original directory in case of error
-        if 'original_cwd' in locals():
-            os.chdir(original_cwd)
-        print(f"Error in run_linter: {str(e)}")
-        raise e
-
-
-def parse_linter_output(output: str, temp_dir: str) -> List[Dict]:
-    """
-    Parse pylint JSON output and ensure all paths are relative to repository
-    """
-    try:
-        if not output.strip():
-            print("Empty linter output")
-            return []
-            
-        data = json.loads(output)
-        issues = []
-        temp_dir = os.path.abspath(temp_dir)
-        
-        print(f"Parsing {len(data)} linter issues")
-        print(f"Repository temp directory: {temp_dir}")
-
-        for item in data:
-            abs_path = item.get("path")
-            
-            if not abs_path:
-                continue
-                
-            # Convert to absolute path if it's relative
-            if not os.path.isabs(abs_path):
-                abs_path = os.path.join(temp_dir, abs_path)
-            
-            # Ensure the file is actually in the repository
-            if not is_file_in_repository(abs_path, temp_dir):
-                print(f"Skipping file outside repository: {abs_path}")
-                continue
-            
-            # Calculate relative path for display
-            try:
-                relative_path = os.path.relpath(abs_path, start=temp_dir)
-            except ValueError:
-                print(f"Could not calculate relative path for: {abs_path}")
-                continue
-            
-            # Skip if relative path goes outside the repo (starts with ..)
-            if relative_path.startswith('..'):
-                print(f"Skipping file outside repository bounds: {relative_path}")
-                continue
-
-            issues.append({
-                "file_path": abs_path,               # Full path for backend processing
-                "display_path": relative_path,       # Clean relative path for display
-                "line_number": item.get("line", 1),
-                "column_number": item.get("column", 1),
-                "code": item.get("message-id", "UNKNOWN"),  
-                "message": item.get("message", "No message"),
-                "symbol": item.get("symbol", ""),
-            })
-
-        print(f"Returning {len(issues)} valid issues")
-        return issues
-
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {str(e)}")
-        print(f"Raw output: {output[:500]}...")  # First 500 chars for debugging
-        return [{"error": f"Invalid JSON from linter: {str(e)}"}]
-    except Exception as e:
-        print(f"Parse error: {str(e)}")
-        return [{"error": f"Failed to parse linter output: {str(e)}"}]
-
-
-def is_file_in_repository(file_path: str, repo_root: str) -> bool:
-    """
-    Check if a file is actually inside the repository directory
-    """
-    try:
-        # Convert both paths to absolute paths
-        file_path = os.path.abspath(file_path)
-        repo_root = os.path.abspath(repo_root)
-        
-        # Check if file path starts with repo root
-        common_path = os.path.commonpath([file_path, repo_root])
-        
-        # File is in repository if the common path is the repository root
-        return common_path == repo_root
-        
-    except (ValueError, OSError) as e:
-        print(f"Error checking if file is in repository: {str(e)}")
+import asyncio
+import hashlib
+import json
+import logging
+import orjson
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from typing import List, Dict, Optional, Union
+
+from pylint.lint import Run
+from pylint.reporters.json_reporter import JSONReporter
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Interned defaults for issue fields: one shared object per default instead
+# of a fresh reference lookup per missing key on thousand-issue reports
+_UNKNOWN = sys.intern("UNKNOWN")
+_NO_MESSAGE = sys.intern("No message")
+_EMPTY = ""
+
+# Parallel AST parsing/inference across cores; capped at 8 since jobs=0 can
+# over-spawn on very wide machines
+PYLINT_JOBS = min(os.cpu_count() or 1, 8)
+
+# Common non-source directories, pruned before pylint ever sees the tree
+IGNORED_DIRS = frozenset(
+    {".git", "node_modules", "__pycache__", ".vscode", ".idea", "venv", "env", ".venv"}
+)
+
+PYLINT_ARGS = [
+    f"--jobs={PYLINT_JOBS}",
+    "--disable=all",
+    "--enable=C0114,C0115,C0301,C0303,C0411,C0412,C0413,C0414,C0415,C0416,D0123,C0417,E0401,E1101,E1102,E1103,E1104,E1105,E1106,E1120,E1121,E1122,E1123",
+]
+
+# pylint mutates process-global state (astroid caches, plugin registry), so
+# in-process runs must not overlap within one process
+_PYLINT_LOCK = threading.Lock()
+
+# Long-lived worker processes keep pylint/astroid imported and warm between
+# requests; without the pool we fall back to linting in this process.
+_WORKER_POOL: Optional[ProcessPoolExecutor] = None
+WORKER_POOL_SIZE = min(os.cpu_count() or 1, 4)
+
+
+def _preload_pylint():
+    """Warm a worker so its first job only pays lint time, not import time."""
+    import astroid          # noqa: F401
+    import pylint.lint      # noqa: F401
+
+
+def _collect_py_files(root: str) -> List[str]:
+    """Walk the tree with scandir, pruning IGNORED_DIRS before descent, and
+    return every .py path. Handing pylint this list instead of the directory
+    means it never walks (or stats) node_modules/venv-style trees itself."""
+    py_files: List[str] = []
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.endswith(".py"):
+                    py_files.append(entry.path)
+    return py_files
+
+
+def _lint_job(abs_path: str, files: Optional[tuple] = None) -> str:
+    # An explicit file list (e.g. the files touched in a PR) scales the lint
+    # with the diff instead of the repo; otherwise lint every .py we find
+    # after pruning ignored directories ourselves
+    targets = list(files) if files else _collect_py_files(abs_path)
+    if not targets:
+        return "[]"
+    buf = StringIO()
+    Run(targets + PYLINT_ARGS, reporter=JSONReporter(buf), exit=False)
+    return buf.getvalue()
+
+
+def start_worker_pool(max_workers: int = WORKER_POOL_SIZE) -> None:
+    """Spawn the persistent lint workers; called from FastAPI startup."""
+    global _WORKER_POOL
+    if _WORKER_POOL is None:
+        _WORKER_POOL = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_preload_pylint
+        )
+
+
+def shutdown_worker_pool() -> None:
+    global _WORKER_POOL
+    if _WORKER_POOL is not None:
+        _WORKER_POOL.shutdown(wait=False, cancel_futures=True)
+        _WORKER_POOL = None
+
+
+def _repo_fingerprint(abs_path: str) -> str:
+    """
+    Cheap content digest of the repo: the git HEAD sha when there is one,
+    otherwise blake2b over (relpath, size, mtime) of every .py file.
+    """
+    head = os.path.join(abs_path, ".git", "HEAD")
+    if os.path.isfile(head):
+        try:
+            with open(head) as fh:
+                ref = fh.read().strip()
+            if ref.startswith("ref:"):
+                ref_file = os.path.join(abs_path, ".git", ref[5:])
+                if os.path.isfile(ref_file):
+                    with open(ref_file) as fh:
+                        return fh.read().strip()
+            else:
+                return ref  # detached HEAD is the sha itself
+        except OSError:
+            pass
+
+    digest = hashlib.blake2b(digest_size=16)
+    stack = [abs_path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in sorted(it, key=lambda e: e.path):
+                if entry.is_dir(follow_symlinks=False):
+                    # Prune the same trees the lint skips, so a vendored
+                    # node_modules/venv is neither statted nor fingerprinted
+                    if entry.name not in IGNORED_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.endswith(".py"):
+                    stat = entry.stat()
+                    digest.update(
+                        f"{os.path.relpath(entry.path, abs_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+                    )
+    return digest.hexdigest()
+
+
+def _lint_job_parsed(abs_path: str, files: Optional[tuple] = None) -> List[Dict]:
+    """
+    Runs inside a worker: lint, then parse the report right there. The
+    potentially megabyte JSON string never crosses the process boundary —
+    only the filtered issue list comes back.
+    """
+    return parse_linter_output(_lint_job(abs_path, files), abs_path)
+
+
+# Parsed-result memo keyed by (fingerprint, relative targets). Entries hold
+# repo-relative paths, so two snapshots of the same content in different temp
+# directories share one entry. An explicit LRU dict rather than
+# functools.lru_cache so the async entry point can probe it without risking a
+# blocking lint on the event loop.
+_RESULT_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_RESULT_CACHE_MAX = 256
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(key: tuple) -> Optional[tuple]:
+    with _RESULT_CACHE_LOCK:
+        issues = _RESULT_CACHE.get(key)
+        if issues is not None:
+            _RESULT_CACHE.move_to_end(key)
+        return issues
+
+
+def _cache_put(key: tuple, issues: tuple) -> None:
+    with _RESULT_CACHE_LOCK:
+        _RESULT_CACHE[key] = issues
+        _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > _RESULT_CACHE_MAX:
+            _RESULT_CACHE.popitem(last=False)
+
+
+def _lint_dispatch(abs_path: str, files: Optional[tuple] = None) -> List[Dict]:
+    if _WORKER_POOL is not None:
+        return _WORKER_POOL.submit(_lint_job_parsed, abs_path, files).result()
+
+    # No pool (tests, scripts): lint here, serialized because pylint's
+    # global state is not reentrant
+    with _PYLINT_LOCK:
+        return _lint_job_parsed(abs_path, files)
+
+
+def _normalize_targets(abs_path: str, files: Optional[List[str]]) -> Optional[tuple]:
+    """Resolve a caller-supplied file list to absolute .py paths inside the
+    repo; None means lint the whole tree."""
+    if not files:
+        return None
+    targets = []
+    prefix = abs_path.rstrip(os.sep) + os.sep
+    for f in files:
+        if not f.endswith(".py"):
+            continue
+        p = f if os.path.isabs(f) else os.path.join(abs_path, f)
+        if p.startswith(prefix) and os.path.isfile(p):
+            targets.append(p)
+    return tuple(sorted(targets)) or None
+
+
+def _result_key(fingerprint: str, prefix: str, targets: Optional[tuple]) -> tuple:
+    """Cache key free of the snapshot directory: fingerprint plus the targets
+    relative to the repo root."""
+    if targets is None:
+        return (fingerprint, None)
+    return (fingerprint, tuple(p[len(prefix):] for p in targets))
+
+
+def _derooted(issues: List[Dict], prefix: str) -> tuple:
+    """Copy issues for caching with file_path made repo-relative."""
+    out = []
+    for issue in issues:
+        fp = issue.get("file_path")
+        if fp and fp.startswith(prefix):
+            issue = {**issue, "file_path": fp[len(prefix):]}
+        out.append(issue)
+    return tuple(out)
+
+
+def _rebased(cached: tuple, prefix: str) -> List[Dict]:
+    """Fresh dicts per caller — cached entries can never be mutated — with
+    file_path rebased onto the caller's repo root."""
+    out = []
+    for issue in cached:
+        issue = dict(issue)
+        fp = issue.get("file_path")
+        if fp and not os.path.isabs(fp):
+            issue["file_path"] = prefix + fp
+        out.append(issue)
+    return out
+
+
+def _has_python_files(root: str) -> bool:
+    """True as soon as one .py file is found; scandir reuses the dirent type
+    info so ruling out a non-Python repo costs one quick walk, not a pylint
+    startup."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.endswith(".py"):
+                    return True
+    return False
+
+
+def _check_repo_path(path: str) -> str:
+    abs_path = os.path.abspath(path)
+
+    if not os.path.exists(abs_path):
+        raise Exception(f"Path does not exist: {abs_path}")
+
+    if not os.path.isdir(abs_path):
+        raise Exception(f"Path is not a directory: {abs_path}")
+
+    return abs_path
+
+
+def lint_repo(path: str, files: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Lint the repository (or just `files` inside it) and return the parsed
+    issue list.
+
+    Jobs go to the persistent worker pool, where pylint and astroid stay
+    imported across requests; results are memoized on a content fingerprint
+    so unchanged repos skip the lint entirely.
+    """
+    abs_path = _check_repo_path(path)
+    if not _has_python_files(abs_path):
+        return []
+    targets = _normalize_targets(abs_path, files)
+    if files and targets is None:
+        return []  # explicit list, but nothing lintable in it
+    prefix = abs_path.rstrip(os.sep) + os.sep
+    key = _result_key(_repo_fingerprint(abs_path), prefix, targets)
+    cached = _cache_get(key)
+    if cached is None:
+        cached = _derooted(_lint_dispatch(abs_path, targets), prefix)
+        _cache_put(key, cached)
+    return _rebased(cached, prefix)
+
+
+async def lint_repo_async(path: str, files: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Async variant of lint_repo: a cache miss is awaited straight from the
+    worker pool, so no event-loop thread — pool or threadpool — sits blocked
+    for the seconds the lint takes.
+    """
+    abs_path = _check_repo_path(path)
+    if not _has_python_files(abs_path):
+        return []
+    targets = _normalize_targets(abs_path, files)
+    if files and targets is None:
+        return []  # explicit list, but nothing lintable in it
+    prefix = abs_path.rstrip(os.sep) + os.sep
+    key = _result_key(_repo_fingerprint(abs_path), prefix, targets)
+    cached = _cache_get(key)
+    if cached is None:
+        if _WORKER_POOL is not None:
+            loop = asyncio.get_running_loop()
+            issues = await loop.run_in_executor(_WORKER_POOL, _lint_job_parsed, abs_path, targets)
+        else:
+            issues = await asyncio.to_thread(_lint_dispatch, abs_path, targets)
+        cached = _derooted(issues, prefix)
+        _cache_put(key, cached)
+    return _rebased(cached, prefix)
+
+
+def run_linter(path: str, files: Optional[List[str]] = None) -> str:
+    """
+    Run pylint on the specific repository path only, returning the raw
+    JSON report. With `files`, only those paths are linted instead of the
+    whole tree. Most callers want lint_repo, which parses and caches.
+    """
+    abs_path = _check_repo_path(path)
+
+    if not _has_python_files(abs_path):
+        return "[]"
+
+    targets = _normalize_targets(abs_path, files)
+    if files and targets is None:
+        return "[]"  # explicit list, but nothing lintable in it
+
+    if _WORKER_POOL is not None:
+        return _WORKER_POOL.submit(_lint_job, abs_path, targets).result()
+
+    with _PYLINT_LOCK:
+        return _lint_job(abs_path, targets)
+
+
+def _iter_repo_issues(data: List[Dict], repo_root_prefix: str):
+    """Yield one issue dict per report entry inside the repo, normalizing
+    paths once per issue. Hot-loop globals are bound to locals so each
+    iteration is a plain LOAD_FAST, not repeated attribute lookups, and
+    item.get is aliased once per issue rather than hashed per field."""
+    isabs = os.path.isabs
+    prefix_len = len(repo_root_prefix)
+    relpaths: Dict[str, str] = {}  # abs_path -> display path, per unique file
+    get_rel = relpaths.get
+    debug_skips = logger.isEnabledFor(logging.DEBUG)
+
+    for item in data:
+        g = item.get
+        abs_path = g("path")
+        if not abs_path:
+            continue
+
+        # Convert to absolute path if it's relative
+        if not isabs(abs_path):
+            abs_path = repo_root_prefix + abs_path
+
+        # Ensure the file is actually in the repository
+        if not abs_path.startswith(repo_root_prefix):
+            if debug_skips:
+                logger.debug("Skipping file outside repository: %s", abs_path)
+            continue
+
+        # The prefix check above makes the display path a pure suffix slice
+        relative_path = get_rel(abs_path)
+        if relative_path is None:
+            relative_path = abs_path[prefix_len:]
+            relpaths[abs_path] = relative_path
+
+        yield {
+            "file_path": abs_path,          # Full path for backend processing
+            "display_path": relative_path,  # Clean relative path for display
+            "line_number": g("line", 1),
+            "column_number": g("column", 1),
+            "code": g("message-id", _UNKNOWN),
+            "message": g("message", _NO_MESSAGE),
+            "symbol": g("symbol", _EMPTY),
+        }
+
+
+def parse_linter_output(output: Union[str, bytes], temp_dir: str) -> List[Dict]:
+    """
+    Parse pylint JSON output and ensure all paths are relative to repository
+    """
+    try:
+        # isspace() scans instead of allocating a stripped copy of a report
+        # that can run to megabytes; orjson accepts str or bytes as-is, so
+        # callers holding raw bytes need no decode pass either
+        if not output or output.isspace():
+            logger.debug("Empty linter output")
+            return []
+
+        data = orjson.loads(output)  # ~5x stdlib json on big reports
+        # Callers hand us the already-absolute repo root from _check_repo_path,
+        # so abspath (and its getcwd syscall) is only a fallback; every issue
+        # below is checked with a plain prefix comparison instead of per-issue
+        # abspath/commonpath work
+        repo_root = temp_dir if os.path.isabs(temp_dir) else os.path.abspath(temp_dir)
+        repo_root_prefix = repo_root.rstrip(os.sep) + os.sep
+
+        logger.debug("Parsing %d linter issues under %s", len(data), repo_root)
+
+        issues = list(_iter_repo_issues(data, repo_root_prefix))
+
+        logger.debug("Returning %d valid issues", len(issues))
+        return issues
+
+    except (orjson.JSONDecodeError, json.JSONDecodeError) as e:
+        logger.warning("JSON decode error: %s; raw output: %.500s", e, output)
+        return [{"error": f"Invalid JSON from linter: {str(e)}"}]
+    except Exception as e:
+        logger.warning("Parse error: %s", e)
+        return [{"error": f"Failed to parse linter output: {str(e)}"}]
+
+
+def is_file_in_repository(file_path: str, repo_root: str) -> bool:
+    """
+    Check if a file is actually inside the repository directory
+    """
+    try:
+        # Convert both paths to absolute paths
+        file_path = os.path.abspath(file_path)
+        repo_root = os.path.abspath(repo_root).rstrip(os.sep)
+
+        # A prefix comparison is equivalent to commonpath == repo_root here
+        # and skips its per-call path splitting
+        return file_path == repo_root or file_path.startswith(repo_root + os.sep)
+
+    except (ValueError, OSError) as e:
+        logger.debug("Error checking if file is in repository: %s", e)
         return False
\ No newline at end of file
@@ -1,22 +1,47 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.auth import router as auth_router
-from app.github_api import router as github_api_router
-from app.analyze import router as analyze_router
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  
-    allow_credentials = True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(auth_router, prefix="/auth",tags=["auth"])
-app.include_router(github_api_router, prefix="/github", tags=["github"])
-app.include_router(analyze_router, prefix="/analyze", tags=["analyze"])
-
-@app.get("/")
-def read_root():
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from app.auth import router as auth_router
+from app.github_api import router as github_api_router
+from app.analyze import router as analyze_router
+from app.linter import start_worker_pool, shutdown_worker_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Persistent lint workers: pylint/astroid imports are paid once at
+    # startup, not on every analyze request
+    start_worker_pool()
+    yield
+    shutdown_worker_pool()
+
+
+# orjson encodes big issue lists several times faster than stdlib json
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Big issue lists compress 5-10x; added before CORS so it wraps the response
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# A concrete origin list (comma-separated ALLOWED_ORIGINS) lets starlette
+# match preflights against a set instead of the wildcard path
+allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=allowed_origins,
+    allow_credentials = True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+app.include_router(auth_router, prefix="/auth",tags=["auth"])
+app.include_router(github_api_router, prefix="/github", tags=["github"])
+app.include_router(analyze_router, prefix="/analyze", tags=["analyze"])
+
+@app.get("/")
+def read_root():
     return {"message": "Welcome to Gitpal!"}
\ No newline at end of file